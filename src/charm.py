@@ -24,6 +24,7 @@ develop a new k8s charm using the Operator Framework:
     https://discourse.charmhub.io/t/4208
 """
 
+import hashlib
 import logging
 import socket
 
@@ -35,6 +36,33 @@ from ops.model import ActiveStatus
 # Log messages can be retrieved using juju debug-log
 logger = logging.getLogger(__name__)
 
+# Written to the workload once setup completes, holding a hash of the config
+# it was run with. It lives in the container so a fresh container is set up again.
+SETUP_MARKER = "/etc/ldap/.charm-setup"
+
+_PEBBLE_LAYER = {
+    "summary": "phpldapadmin layer",
+    "description": "pebble config layer for phpldapadmin",
+    "services": {
+        "phpldapadmin": {
+            "override": "replace",
+            "summary": "phpldapadmin",
+            "command": "/usr/sbin/apache2ctl -DFOREGROUND",
+            "startup": "enabled",
+        },
+        "slapd": {
+            "override": "replace",
+            "summary": "slapd",
+            "command": "/usr/sbin/slapd -d 0",
+            "startup": "enabled",
+        },
+    },
+}
+
+# Templates ship with the charm and never change while a hook runs, so a
+# single environment is shared and compiled templates are never reloaded.
+_JINJA_ENV = jinja2.Environment(loader=jinja2.FileSystemLoader("src/templates"), auto_reload=False)
+
 
 class CharmLdapTestFixtureK8SCharm(CharmBase):
     """Charm the service."""
@@ -52,9 +80,24 @@ class CharmLdapTestFixtureK8SCharm(CharmBase):
     def _get_ldap_url_action(self, event: ActionEvent) -> None:
         # This charm has no relations so it has no network
         # bindings so cannot get ip through ops framework
-        hostname = socket.gethostname()
-        ip = socket.gethostbyname(hostname)
-        event.set_results({"url": "ldap://{}".format(ip)})
+        try:
+            url = self._get_ldap_url()
+        except socket.gaierror as e:
+            event.fail(f"Unable to resolve unit address: {e}")
+            return
+        event.set_results({"url": url})
+
+    def _get_ldap_url(self):
+        """Return the ldap url for the unit ip."""
+        addresses = socket.getaddrinfo(
+            socket.gethostname(),
+            None,
+            family=socket.AF_INET,
+            type=socket.SOCK_STREAM,
+            flags=socket.AI_ADDRCONFIG,
+        )
+        ip = addresses[0][4][0]
+        return f"ldap://{ip}"
 
     def configure_slap_pkg(self, container):
         """Configure  slapd in container."""
@@ -67,9 +110,7 @@ class CharmLdapTestFixtureK8SCharm(CharmBase):
             "slapd shared/organization string test",
         ]
         process = container.exec(["debconf-set-selections"])
-        for line in slap_settings:
-            process.stdin.write(line + "\n")
-            process.stdin.flush()
+        process.stdin.write("\n".join(slap_settings) + "\n")
         process.stdin.close()
         process.wait()
         process = container.exec(["dpkg-reconfigure", "-f", "noninteractive", "slapd"])
@@ -80,56 +121,59 @@ class CharmLdapTestFixtureK8SCharm(CharmBase):
         """Return dc for config."""
         return ",".join([f"dc={d}" for d in self.config["domain"].split(".")])
 
-    def setup_slap_users(self, container):
+    def setup_slap_users(self, container, dc):
         """Add test users to slapd in container."""
-        gid_counter = 500
-        uid_counter = 1000
-        context = {"dc": self.dc}
-        groups = []
-        users = []
-        for group in ["admin", "openstack"]:
-            groups.append({"gidnumber": gid_counter, "cn": group})
-            gid_counter += 1
-
+        groups = [
+            {"gidnumber": 500 + i, "cn": group} for i, group in enumerate(["admin", "openstack"])
+        ]
         user_gid = groups[0]["gidnumber"]
-        for user in self.config["users"].split(","):
-            name = user.replace(" ", "").lower()
-            users.append(
-                {
-                    "uidnumber": uid_counter,
-                    "uid": name,
-                    "sn": user,
-                    "first": user.split()[0],
-                    "gidnumber": user_gid,
-                }
-            )
-            uid_counter += 1
-
-        context["groups"] = groups
-        context["users"] = users
-        loader = jinja2.FileSystemLoader("src/templates")
-        _tmpl_env = jinja2.Environment(loader=loader)
-        template = _tmpl_env.get_template("setup.ldif.j2")
-        container.push("/tmp/setup.ldif", template.render(context))
-        process = container.exec(["slapadd", "-v", "-c", "-l", "/tmp/setup.ldif"])
+        users = [
+            {
+                "uidnumber": 1000 + i,
+                "uid": user.replace(" ", "").lower(),
+                "sn": user,
+                "first": user.split()[0],
+                "gidnumber": user_gid,
+            }
+            for i, user in enumerate(self.config["users"].split(","))
+        ]
+        context = {"dc": dc, "groups": groups, "users": users}
+        template = _JINJA_ENV.get_template("setup.ldif.j2")
+        # slapadd reads LDIF from stdin when no input file is given.
+        process = container.exec(["slapadd", "-v", "-c"], stdin=template.render(context))
         process.wait()
 
-    def setup_php(self, container):
+    def setup_php(self, container, dc):
         """Configure phpldapadmin in container."""
-        current_contents = container.pull("/etc/phpldapadmin/config.php")
-        new_contents = ""
-        for line in current_contents:
-            new_contents += line.replace("dc=example,dc=com", self.dc)
+        with container.pull("/etc/phpldapadmin/config.php") as config_file:
+            current_contents = config_file.read()
+        new_contents = current_contents.replace("dc=example,dc=com", dc)
+        if new_contents == current_contents:
+            logger.debug("phpldapadmin config already up to date")
+            return
         container.push("/etc/phpldapadmin/config.php", new_contents)
 
     def setup(self):
         """Configure container."""
         container = self.unit.get_container("phpldapadmin")
+        dc = self.dc
         self.configure_slap_pkg(container)
-        self.setup_php(container)
-        self.setup_slap_users(container)
+        self.setup_php(container, dc)
+        self.setup_slap_users(container, dc)
         container.restart("phpldapadmin", "slapd")
 
+    def _setup_config_hash(self):
+        """Return a hash of the config options setup depends on."""
+        setup_config = f"{self.config['domain']}|{self.config['users']}"
+        return hashlib.sha256(setup_config.encode()).hexdigest()
+
+    def _setup_marker(self, container):
+        """Return the config hash recorded by the last setup, if any."""
+        if not container.exists(SETUP_MARKER):
+            return None
+        with container.pull(SETUP_MARKER) as marker:
+            return marker.read()
+
     def _on_phpldapadmin_pebble_ready(self, event):
         """Define and start a workload using the Pebble API.
 
@@ -141,36 +185,19 @@ class CharmLdapTestFixtureK8SCharm(CharmBase):
         # Get a reference the container attribute on the PebbleReadyEvent
         container = event.workload
         # Add initial Pebble config layer using the Pebble API
-        container.add_layer("phpldapadmin", self._pebble_layer, combine=True)
+        container.add_layer("phpldapadmin", _PEBBLE_LAYER, combine=True)
         # Make Pebble reevaluate its plan, ensuring any services are started if enabled.
         container.replan()
         # Learn more about statuses in the SDK docs:
         # https://juju.is/docs/sdk/constructs#heading--statuses
-        self.setup()
+        config_hash = self._setup_config_hash()
+        if self._setup_marker(container) == config_hash:
+            logger.info("Workload already configured, skipping setup")
+        else:
+            self.setup()
+            container.push(SETUP_MARKER, config_hash, make_dirs=True)
         self.unit.status = ActiveStatus()
 
-    @property
-    def _pebble_layer(self):
-        """Return a dictionary representing a Pebble layer."""
-        return {
-            "summary": "phpldapadmin layer",
-            "description": "pebble config layer for phpldapadmin",
-            "services": {
-                "phpldapadmin": {
-                    "override": "replace",
-                    "summary": "phpldapadmin",
-                    "command": "/usr/sbin/apache2ctl -DFOREGROUND",
-                    "startup": "enabled",
-                },
-                "slapd": {
-                    "override": "replace",
-                    "summary": "slapd",
-                    "command": "/usr/sbin/slapd -d 0",
-                    "startup": "enabled",
-                },
-            },
-        }
-
 
 if __name__ == "__main__":  # pragma: nocover
     main(CharmLdapTestFixtureK8SCharm)